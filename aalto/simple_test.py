@@ -4,76 +4,250 @@
 Very simple example, for a few bottleneck tests
 """
 
-from mininet.topo import Topo
+import json
+import os
+from glob import glob
+from time import sleep, time
+from subprocess import PIPE
+from concurrent.futures import ProcessPoolExecutor
+
 from mininet.net import Mininet
-from mininet.node import CPULimitedHost
+from mininet.node import CPULimitedHost, DefaultController
 from mininet.link import TCLink
-from mininet.log import setLogLevel, info
-
-
-class TopoCommon( Topo ):
-    "Common topology for few different bottleneck tests."
-
-    def build( self, bottleneck ):
-        # Add hosts and switches
-        leftHost1 = self.addHost( 'lh1' )
-        leftHost2 = self.addHost( 'lh2' )
-        rightHost1 = self.addHost( 'rh1' )
-        rightHost2 = self.addHost( 'rh2' )
-        leftSwitch = self.addSwitch( 's1' )
-        rightSwitch = self.addSwitch( 's2' )
-
-        # Add links
-        self.addLink( leftHost1, leftSwitch )
-        self.addLink( leftHost2, leftSwitch )
-        self.addLink( rightSwitch, rightHost1 )
-        self.addLink( rightSwitch, rightHost2 )
-
-        # This is the bottleneck link for which we vary the parameters
-        self.addLink( leftSwitch, rightSwitch, cls=TCLink, **bottleneck)
-
-
-
-def runOne(testname, bottleneck):
-    "Create network and run single performance test"
-
-    info("\nStarting test: %s\n" % testname)
-
-    topo = TopoCommon( bottleneck=bottleneck )
+from mininet.log import setLogLevel, info, error
+from mininet.util import custom, fmtBps, sysctlTestAndSet
+
+from topologies import TopoCommon, bottlenecks
+
+
+def parseCpuList(cpulist):
+    "Parse a kernel cpu list such as '0-3,8' into a set of cpu numbers"
+    cpus = set()
+    for part in cpulist.strip().split( ',' ):
+        if part:
+            first, _, last = part.partition( '-' )
+            cpus.update( range( int( first ), int( last or first ) + 1 ) )
+    return cpus
+
+
+def cpuPairs():
+    """Return ( client, server ) pairs of usable cpus. Both cpus of a pair
+       are on the same NUMA node but on distinct physical cores, so that
+       traffic between the two ends of a veth stays in a shared cache.
+       Falls back to ( cpu, cpu ) pairs if no such pairs exist."""
+    allowed = os.sched_getaffinity( 0 )
+    nodes = []
+    for path in sorted( glob( '/sys/devices/system/node/node[0-9]*' ) ):
+        with open( path + '/cpulist' ) as f:
+            nodes.append( parseCpuList( f.read() ) & allowed )
+    if not nodes:
+        nodes = [ allowed ]
+    pairs = []
+    for cpus in nodes:
+        # Keep one hyperthread per physical core
+        cores = []
+        for cpu in sorted( cpus ):
+            path = ( '/sys/devices/system/cpu/cpu%d/topology/'
+                     'thread_siblings_list' % cpu )
+            try:
+                with open( path ) as f:
+                    siblings = parseCpuList( f.read() )
+            except IOError:
+                siblings = { cpu }
+            if cpu == min( siblings & cpus or { cpu } ):
+                cores.append( cpu )
+        pairs += zip( cores[ 0::2 ], cores[ 1::2 ] )
+    return pairs or [ ( cpu, cpu ) for cpu in sorted( allowed ) ]
+
+
+def staticArp(net):
+    """Add all-pairs ARP entries with one 'ip -batch' run per host,
+       instead of one 'arp -s' per host pair"""
+    for src in net.hosts:
+        cmds = ''.join( 'neigh replace %s lladdr %s dev %s\n' %
+                        ( dst.IP(), dst.MAC(), src.defaultIntf() )
+                        for dst in net.hosts if dst != src )
+        src.popen( [ 'ip', '-batch', '-' ], stdin=PIPE ).communicate(
+            cmds.encode() )
+
+
+def disableOffloads(net):
+    """Turn off segmentation and receive offloads on all interfaces, so
+       that netem delays and drops individual MTU-sized packets rather
+       than 64KB super-packets"""
+    for node in net.hosts + net.switches:
+        for intf in node.intfList():
+            if intf.name != 'lo':
+                node.cmd( 'ethtool -K', intf, 'gso off tso off gro off' )
+
+
+def waitIperfServer(server, serverProc, port=5201, timeout=5):
+    """Wait until the iperf3 server on node server listens on port.
+       We cannot use waitListening(): its probe connection would use up
+       the only session of an 'iperf3 -s -1' server.
+       returns: True if the server is listening"""
+    deadline = time() + timeout
+    while time() < deadline:
+        if server.cmd( "ss -Htln 'sport = :%d'" % port ).strip():
+            return True
+        if serverProc.poll() is not None:
+            break
+        sleep( .1 )
+    return False
+
+
+def runIperf(testname, client, server, streams=1, duration=10,
+             zerocopy=True, length='128K', window='4M'):
+    """Run a single iperf3 test from client to server
+       streams: number of parallel TCP streams (iperf3 -P)
+       duration: test length in seconds
+       zerocopy: send with sendfile() (iperf3 -Z)
+       length: read/write buffer length (iperf3 -l)
+       window: socket buffer size (iperf3 -w), or None for autotuning"""
+
+    # Client and server cores, out of the ones we were pinned to
+    cpus = sorted( os.sched_getaffinity( 0 ) )
+    clientCpu, serverCpu = cpus[ 0 ], cpus[ -1 ]
+
+    # Start iperf3 server and client with given command line parameters.
+    # Output is streamed straight to file instead of being buffered here;
+    # client and server reports go to separate files so they do not
+    # interleave. Errors are reported inside the JSON documents.
+    clientPath = 'iperf-%s.json' % testname
+    with open( clientPath, 'w' ) as clientFile, \
+         open( 'iperf-%s-server.json' % testname, 'w' ) as serverFile:
+        # Server starts in the background and exits after one test.
+        serverProc = server.popen( [ 'iperf3', '-s', '-1',
+                                     '-A', str( serverCpu ), '--json' ],
+                                   stdout=serverFile, stderr=None )
+        if not waitIperfServer( server, serverProc ):
+            error( '%s: iperf3 server did not start\n' % testname )
+            serverProc.terminate()
+            serverProc.wait()
+            return
+
+        # Execution blocks here until client has finished.
+        clientCmd = [ 'iperf3', '-c', server.IP(),
+                      '-P', str( streams ),
+                      '-A', '%d,%d' % ( clientCpu, serverCpu ),
+                      '-t', str( duration ), '-l', length, '--json' ]
+        if zerocopy:
+            clientCmd.append( '--zerocopy' )
+        if window:
+            clientCmd += [ '-w', window ]
+        clientProc = client.popen( clientCmd, stdout=clientFile,
+                                   stderr=None )
+        clientProc.wait()
+
+        # The server exits by itself after a completed test
+        if clientProc.returncode != 0:
+            serverProc.terminate()
+        serverProc.wait()
+
+    try:
+        with open( clientPath ) as clientFile:
+            result = json.load( clientFile )
+    except ValueError:
+        # Empty or truncated output, e.g. iperf3 could not be started
+        error( '%s: no iperf3 result in %s\n' % ( testname, clientPath ) )
+        return
+    if 'error' in result:
+        error( '%s: iperf3 error: %s\n' % ( testname, result[ 'error' ] ) )
+    else:
+        received = result[ 'end' ][ 'sum_received' ][ 'bits_per_second' ]
+        info( '%s: %s\n' % ( testname, fmtBps( received ) ) )
+
+
+def runScenarios(scenarios, index=0, cpus=None, sched='cfs', cpu=-1,
+                 **iperfArgs):
+    """Create network once and run performance tests on it, changing
+       only the bottleneck link parameters between tests
+       scenarios: list of ( testname, bottleneck ) pairs
+       index: network index, used to keep concurrent networks apart
+       cpus: cores to pin this network (and its child processes) to;
+             iperf3 client and server use the lowest and highest one.
+             Defaults to the first pair from cpuPairs()
+       sched: host cgroup scheduler, 'cfs' (cpu.max quota) or 'rt'
+       cpu: CPU fraction per host; -1 (unlimited) only works with 'cfs'
+       iperfArgs: additional arguments for runIperf()"""
+
+    if sched == 'rt' and cpu <= 0:
+        raise ValueError( "sched='rt' needs a positive cpu fraction" )
+
+    # Pin before any node is spawned so that mnexec, tc and iperf
+    # inherit the affinity from us
+    if cpus is None:
+        cpus = set( cpuPairs()[ 0 ] )
+    os.sched_setaffinity( 0, cpus )
+
+    # Let iperf3 -w get the socket buffers it asks for. These limits
+    # are global rather than per namespace, so set them from here.
+    sysctlTestAndSet( 'net.core.rmem_max', 67108864 )
+    sysctlTestAndSet( 'net.core.wmem_max', 67108864 )
+
+    first, second = 2 * index + 1, 2 * index + 2
+    _testname, bottleneck = scenarios[ 0 ]
+    topo = TopoCommon( bottleneck=bottleneck, index=index )
     net = Mininet( topo=topo,
-                   host=CPULimitedHost, link=TCLink,
-                   autoStaticArp=True )
-    net.start()
-    lh1, rh2 = net.getNodeByName('lh1', 'rh2')
-
-    # Start iperf server and client with given command line parameters
-    # Server starts in the background.
-    server = rh2.popen(['iperf', '-s', '-e', '-i' '1', '-l', '8K'])
-
-    # Execution blocks here until client has finished.
-    clientout = lh1.cmd(['iperf', '-c', '10.0.0.4', '-e', '-i', '1'])
-
-    # Terminate server and collect stdout output.
-    server.terminate()
-    servout, _ = server.communicate()
-    
-    # Write outputs from client and server to file
-    with open('iperf-%s.txt' % testname, 'w') as file:
-        file.write(clientout)
-        file.write(servout.decode())
-
-    net.stop()
+                   host=custom( CPULimitedHost, sched=sched, cpu=cpu,
+                                period_us=100000 ),
+                   link=TCLink,
+                   controller=None,
+                   ipBase='10.%d.0.0/16' % index )
+    # Always clean up, so a failing test cannot leave namespaces,
+    # bridges and the controller behind
+    try:
+        # Name the controller per worker, so each one gets its own
+        # port and its own /tmp/cN.log
+        net.addController( 'c%d' % index, DefaultController,
+                           port=6653 + index )
+        staticArp( net )
+        net.start()
+        disableOffloads( net )
+        # Scenarios share the same hosts and addresses; keep TCP from
+        # starting each test with the previous bottleneck's cached
+        # ssthresh and RTT (this sysctl is per namespace)
+        for host in net.hosts:
+            host.cmd( 'sysctl -qw net.ipv4.tcp_no_metrics_save=1' )
+        lh1, rh2 = net.getNodeByName( 'lh%d' % first, 'rh%d' % second )
+        s1, s2 = net.getNodeByName( 's%d' % first, 's%d' % second )
+        link = net.linksBetween( s1, s2 )[ 0 ]
+
+        # Pace the sender with fq, so that the bottleneck netem sees a
+        # smooth stream rather than line-rate bursts
+        lh1.cmd( 'tc qdisc replace dev', lh1.defaultIntf(), 'root fq' )
+
+        for i, ( testname, bottleneck ) in enumerate( scenarios ):
+            info( "\nStarting test: %s\n" % testname )
+            # The network was built with the first bottleneck; for the
+            # others, reconfigure the tc qdiscs on both ends of the link
+            if i > 0:
+                for intf in ( link.intf1, link.intf2 ):
+                    intf.config( **bottleneck )
+            runIperf( testname, lh1, rh2, **iperfArgs )
+    finally:
+        net.stop()
+
+
+def runOne(testname, bottleneck, **kwargs):
+    """Create network and run single performance test
+       kwargs: additional arguments for runScenarios()"""
+    runScenarios( [ ( testname, bottleneck ) ], **kwargs )
 
 
 def runAll():
-    topologies = {
-      'slow': { 'max_queue_size': 5, 'bw': 0.1, 'delay': '200ms' },
-      'buffered': { 'max_queue_size': 200, 'bw': 0.1, 'delay': '200ms' },
-      'lossy': { 'loss': 10, 'bw': 10, 'delay': '20ms' },
-      'latency': { 'bw': 10, 'delay': '400ms' },
-    }
-    for t in topologies.keys():
-        runOne(t, topologies[t])
+    """Run all bottleneck tests, spread over one network per available
+       pair of cores; each network is reused for all of its tests"""
+    scenarios = list( bottlenecks.items() )
+    pairs = cpuPairs()
+    workers = min( len( scenarios ), len( pairs ) )
+    with ProcessPoolExecutor( max_workers=workers ) as executor:
+        futures = [ executor.submit( runScenarios, scenarios[ i::workers ],
+                                     i, set( pairs[ i ] ) )
+                    for i in range( workers ) ]
+        # Wait for all tests, re-raising any failure
+        for future in futures:
+            future.result()
 
 
 if __name__ == '__main__':
@@ -12,6 +12,7 @@
 from mininet.node import CPULimitedHost
 from mininet.link import TCLink
 from mininet.log import setLogLevel, info
+from mininet.util import custom
 
 
 class SimpleTopo( Topo ):
@@ -37,15 +38,21 @@ def build( self, bottleneck ):
         self.addLink( leftSwitch, rightSwitch, cls=TCLink, **bottleneck)
 
 
-parser = argparse.ArgumentParser(description='Mininet Custom Topology with Bandwidth Parameter')
-parser.add_argument('--bw', type=float, help='Bottleneck link bandwidth in Mbps', default=10)
-parser.add_argument('--loss', type=float, help='Bottleneck packet loss probability', default=0)
-parser.add_argument('--delay', type=str, help='Bottleneck propagation time', default='10ms')
-parser.add_argument('--queue', type=float, help='Bottleneck queue length', default=20)
-parser.add_argument('--ecn', action='store_true')
-args = parser.parse_args()
-
-if __name__ == '__main__':
+def _main():
+    "Parse command line arguments, then start network and CLI"
+    parser = argparse.ArgumentParser(description='Mininet Custom Topology with Bandwidth Parameter')
+    parser.add_argument('--bw', type=float, help='Bottleneck link bandwidth in Mbps', default=10)
+    parser.add_argument('--loss', type=float, help='Bottleneck packet loss probability', default=0)
+    parser.add_argument('--delay', type=str, help='Bottleneck propagation time', default='10ms')
+    parser.add_argument('--queue', type=float, help='Bottleneck queue length', default=20)
+    parser.add_argument('--ecn', action='store_true')
+    parser.add_argument('--sched', choices=['cfs', 'rt'], default='cfs',
+                        help='Host CPU scheduler: cfs quota (default) or rt')
+    parser.add_argument('--cpu', type=float, default=-1,
+                        help='CPU fraction per host (required for rt)')
+    args = parser.parse_args()
+    if args.sched == 'rt' and args.cpu <= 0:
+        parser.error('--sched rt needs a positive --cpu fraction')
 
     # Bottleneck attributes as taken from command line arguments
     bottleneck = {
@@ -57,7 +64,9 @@ def build( self, bottleneck ):
     }
 
     topo = SimpleTopo( bottleneck=bottleneck )
-    net = Mininet(topo=topo, host=CPULimitedHost, link=TCLink)
+    host = custom(CPULimitedHost, sched=args.sched, cpu=args.cpu,
+                  period_us=100000)
+    net = Mininet(topo=topo, host=host, link=TCLink)
     
     # Add NAT with default configuration. This is the gateway between the
     # outside world and mininet topology. NAT is connected to switch s1.
@@ -69,3 +78,18 @@ def build( self, bottleneck ):
     net.start()
     CLI(net)
     net.stop()
+
+
+# Allows e.g. sudo mn --custom aalto/simple_topo.py --link=tc \
+#   --topo simple,bw=100,delay=20ms
+topos = {
+    'simple': ( lambda bw=10, loss=0, delay='10ms', queue=20, ecn=False:
+                SimpleTopo( bottleneck={ 'bw': bw, 'loss': loss,
+                                         'delay': delay,
+                                         'max_queue_size': queue,
+                                         'enable_ecn': ecn } ) )
+}
+
+
+if __name__ == '__main__':
+    _main()
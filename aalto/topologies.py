@@ -11,109 +11,42 @@
 
 
 from mininet.topo import Topo
+from mininet.link import TCLink
 
-class TopoLatency( Topo ):
-    "Long latency"
 
-    def __init__( self ):
-        "Create custom topo."
+class TopoCommon( Topo ):
+    "Common topology for few different bottleneck tests."
 
-        # Initialize topology
-        Topo.__init__( self )
-
-        # Add hosts and switches
-        leftHost1 = self.addHost( 'lh1' )
-        leftHost2 = self.addHost( 'lh2' )
-        rightHost1 = self.addHost( 'rh1' )
-        rightHost2 = self.addHost( 'rh2' )
-        leftSwitch = self.addSwitch( 's1' )
-        rightSwitch = self.addSwitch( 's2' )
-
-        # Add links
-        self.addLink( leftHost1, leftSwitch )
-        self.addLink( leftHost2, leftSwitch )
-        self.addLink( leftSwitch, rightSwitch, bw=10, delay='400ms' )
-        self.addLink( rightSwitch, rightHost1 )
-        self.addLink( rightSwitch, rightHost2 )
-
-
-class TopoSlow( Topo ):
-    "Basic Slow topology small buffers."
-
-    def __init__( self ):
-        "Create custom topo."
-
-        # Initialize topology
-        Topo.__init__( self )
-
-        # Add hosts and switches
-        leftHost1 = self.addHost( 'lh1' )
-        leftHost2 = self.addHost( 'lh2' )
-        rightHost1 = self.addHost( 'rh1' )
-        rightHost2 = self.addHost( 'rh2' )
-        leftSwitch = self.addSwitch( 's1' )
-        rightSwitch = self.addSwitch( 's2' )
-
-        # Add links
-        self.addLink( leftHost1, leftSwitch )
-        self.addLink( leftHost2, leftSwitch )
-        self.addLink( leftSwitch, rightSwitch, max_queue_size=5, bw=0.1, delay='200ms' )
-        self.addLink( rightSwitch, rightHost1 )
-        self.addLink( rightSwitch, rightHost2 )
-
-
-class TopoSlowBuffered( Topo ):
-    "Slow overbuffered bottleneck."
-
-    def __init__( self ):
-        "Create custom topo."
-
-        # Initialize topology
-        Topo.__init__( self )
-
-        # Add hosts and switches
-        leftHost1 = self.addHost( 'lh1' )
-        leftHost2 = self.addHost( 'lh2' )
-        rightHost1 = self.addHost( 'rh1' )
-        rightHost2 = self.addHost( 'rh2' )
-        leftSwitch = self.addSwitch( 's1' )
-        rightSwitch = self.addSwitch( 's2' )
+    def build( self, bottleneck, index=0 ):
+        # Add hosts and switches. Node numbering is offset by the
+        # scenario index so that concurrently running scenarios do not
+        # clash on cgroups or switch interfaces in the root namespace.
+        first, second = 2 * index + 1, 2 * index + 2
+        leftHost1 = self.addHost( 'lh%d' % first )
+        leftHost2 = self.addHost( 'lh%d' % second )
+        rightHost1 = self.addHost( 'rh%d' % first )
+        rightHost2 = self.addHost( 'rh%d' % second )
+        leftSwitch = self.addSwitch( 's%d' % first )
+        rightSwitch = self.addSwitch( 's%d' % second )
 
         # Add links
         self.addLink( leftHost1, leftSwitch )
         self.addLink( leftHost2, leftSwitch )
-        self.addLink( leftSwitch, rightSwitch, max_queue_size=200, bw=0.1, delay='200ms' )
         self.addLink( rightSwitch, rightHost1 )
         self.addLink( rightSwitch, rightHost2 )
 
+        # This is the bottleneck link for which we vary the parameters
+        self.addLink( leftSwitch, rightSwitch, cls=TCLink, **bottleneck )
 
-class TopoLossy( Topo ):
-    "10% packet loss rate"
-
-    def __init__( self ):
-        "Create custom topo."
-
-        # Initialize topology
-        Topo.__init__( self )
-
-        # Add hosts and switches
-        leftHost1 = self.addHost( 'lh1' )
-        leftHost2 = self.addHost( 'lh2' )
-        rightHost1 = self.addHost( 'rh1' )
-        rightHost2 = self.addHost( 'rh2' )
-        leftSwitch = self.addSwitch( 's1' )
-        rightSwitch = self.addSwitch( 's2' )
 
-        # Add links
-        self.addLink( leftHost1, leftSwitch )
-        self.addLink( leftHost2, leftSwitch )
-        self.addLink( leftSwitch, rightSwitch, loss=10, bw=10, delay='20ms' )
-        self.addLink( rightSwitch, rightHost1 )
-        self.addLink( rightSwitch, rightHost2 )
-
-
-topos = { 'latency': ( lambda: TopoLatency() ),
-          'slow': (lambda: TopoSlow() ),
-          'buffers': ( lambda: TopoSlowBuffered() ),
-          'lossy': (lambda: TopoLossy() )
+# Bottleneck link parameters for each test
+bottlenecks = {
+    'latency': { 'bw': 10, 'delay': '400ms' },
+    'slow': { 'max_queue_size': 5, 'bw': 0.1, 'delay': '200ms' },
+    'buffers': { 'max_queue_size': 200, 'bw': 0.1, 'delay': '200ms' },
+    'lossy': { 'loss': 10, 'bw': 10, 'delay': '20ms' },
 }
+
+topos = { name: ( lambda bottleneck=bottleneck:
+                  TopoCommon( bottleneck=bottleneck ) )
+          for name, bottleneck in bottlenecks.items() }
@@ -27,6 +27,9 @@
 
 from subprocess import call
 from cmd import Cmd
+from collections import ChainMap, deque
+from collections.abc import Mapping
+from contextlib import contextmanager
 from os import isatty
 from select import poll, POLLIN
 import select
@@ -35,11 +38,12 @@
 import time
 import os
 import atexit
+import termios
 
 from mininet.log import info, output, error
 from mininet.term import makeTerms, runX11
 from mininet.util import ( quietRun, dumpNodeConnections,
-                           dumpPorts )
+                           dumpPorts, getincrementaldecoder, parallelMap )
 
 class CLI( Cmd ):
     "Simple command-line interface to talk to nodes."
@@ -53,11 +57,9 @@ def __init__( self, mininet, stdin=sys.stdin, script=None,
            stdin: standard input for CLI
            script: script to run in batch mode"""
         self.mn = mininet
-        # Local variable bindings for py command
-        self.locals = { 'net': mininet }
-        # Attempt to handle input
-        self.inPoller = poll()
-        self.inPoller.register( stdin )
+        # Local variable bindings for py command; node names are looked
+        # up through the net itself instead of being copied in
+        self.locals = ChainMap( { 'net': mininet }, NodeMap( mininet ) )
         self.inputFile = script
         Cmd.__init__( self, stdin=stdin, **kwargs )
         info( '*** Starting CLI:\n' )
@@ -66,10 +68,13 @@ def __init__( self, mininet, stdin=sys.stdin, script=None,
             self.do_source( self.inputFile )
             return
 
-        self.initReadline()
+        # History is only useful (and only worth loading) interactively
+        if self.isatty():
+            self.initReadline()
         self.run()
 
     readlineInited = False
+    historyLength = 1000
 
     @classmethod
     def initReadline( cls ):
@@ -77,18 +82,34 @@ def initReadline( cls ):
         # Only set up readline once to prevent multiplying the history file
         if cls.readlineInited:
             return
+        # readline reads sys.stdin; skip history for piped input
+        if not sys.stdin.isatty():
+            return
         cls.readlineInited = True
         try:
             # pylint: disable=import-outside-toplevel
-            from readline import ( read_history_file, write_history_file,
-                                   set_history_length )
+            import readline
+            from readline import ( add_history, read_history_file,
+                                   write_history_file, set_history_length )
         except ImportError:
             pass
         else:
             history_path = os.path.expanduser( '~/.mininet_history' )
+            set_history_length( cls.historyLength )
             if os.path.isfile( history_path ):
-                read_history_file( history_path )
-                set_history_length( 1000 )
+                if 'libedit' in ( readline.__doc__ or '' ):
+                    # libedit writes a header line and escapes entries,
+                    # so let it parse its own file
+                    read_history_file( history_path )
+                else:
+                    # GNU readline writes one plain line per entry; only
+                    # hand the most recent ones to readline, rather than
+                    # loading the whole file and truncating it afterwards
+                    with open( history_path,
+                               errors='replace' ) as historyFile:
+                        for entry in deque( historyFile,
+                                            maxlen=cls.historyLength ):
+                            add_history( entry.rstrip( '\n' ) )
 
             def writeHistory():
                 "Write out history file"
@@ -101,16 +122,26 @@ def writeHistory():
 
     def run( self ):
         "Run our cmdloop(), catching KeyboardInterrupt"
+        saneAttrs = None
         while True:
             try:
-                # Make sure no nodes are still waiting
+                # Make sure no nodes are still waiting. We only get here
+                # on startup and after an interrupt, which may have hit
+                # any Node.cmd() (pingall, iperf, dpctl...), so check all
                 for node in self.mn.values():
                     while node.waiting:
                         info( 'stopping', node, '\n' )
                         node.sendInt()
                         node.waitOutput()
                 if self.isatty():
-                    quietRun( 'stty echo sane intr ^C' )
+                    # Set up the terminal once with stty, then restore
+                    # that state directly after each interrupt
+                    fd = self.stdin.fileno()
+                    if saneAttrs is None:
+                        quietRun( 'stty echo sane intr ^C' )
+                        saneAttrs = termios.tcgetattr( fd )
+                    else:
+                        termios.tcsetattr( fd, termios.TCSANOW, saneAttrs )
                 self.cmdloop()
                 break
             except KeyboardInterrupt:
@@ -128,14 +159,11 @@ def emptyline( self ):
 
     def getLocals( self ):
         "Local variable bindings for py command"
-        self.locals.update( self.mn )
         return self.locals
 
     def precmd( self, line ):
         "allow for comments in the cli"
-        if '#' in line:
-            line = line.split( '#' )[ 0 ]
-        return line
+        return line.partition( '#' )[ 0 ]
 
     # ==========================================================================
     # HELP AND INFORMATION COMMANDS
@@ -181,19 +209,21 @@ def do_net( self, _line ):
 
     def do_intfs( self, _line ):
         "List interfaces."
-        for node in self.mn.values():
-            output( '%s: %s\n' %
-                    ( node.name, ','.join( node.intfNames() ) ) )
+        output( ''.join( '%s: %s\n' %
+                         ( node.name, ','.join( node.intfNames() ) )
+                         for node in self.mn.values() ) )
 
     def do_dump( self, _line ):
         "Dump node info."
-        for node in self.mn.values():
-            output( '%s\n' % repr( node ) )
+        output( ''.join( '%s\n' % repr( node )
+                         for node in self.mn.values() ) )
 
     def do_links( self, _line ):
         "Report on links"
-        for link in self.mn.links:
-            output( link, link.status(), '\n' )
+        links = self.mn.links
+        for link, status in zip( links, parallelMap(
+                lambda link: link.status(), links ) ):
+            output( link, status, '\n' )
 
     # ==========================================================================
     # NETWORK TESTING COMMANDS
@@ -222,19 +252,13 @@ def do_pingpairfull( self, _line ):
     def do_iperf( self, line ):
         """Simple iperf TCP test between two (optionally specified) hosts.
            Usage: iperf node1 node2"""
-        args = line.split()
+        # At most 3 fields: enough to tell 2 args from too many
+        args = line.split( None, 2 )
         if not args:
             self.mn.iperf()
         elif len(args) == 2:
-            hosts = []
-            err = False
-            for arg in args:
-                if arg not in self.mn:
-                    err = True
-                    error( "node '%s' not in network\n" % arg )
-                else:
-                    hosts.append( self.mn[ arg ] )
-            if not err:
+            hosts = self._lookupHosts( args )
+            if hosts:
                 self.mn.iperf( hosts )
         else:
             error( 'invalid number of args: iperf src dst\n' )
@@ -242,25 +266,30 @@ def do_iperf( self, line ):
     def do_iperfudp( self, line ):
         """Simple iperf UDP test between two (optionally specified) hosts.
            Usage: iperfudp bw node1 node2"""
-        args = line.split()
+        # At most 4 fields: enough to tell 3 args from too many
+        args = line.split( None, 3 )
         if not args:
             self.mn.iperf( l4Type='UDP' )
         elif len(args) == 3:
             udpBw = args[ 0 ]
-            hosts = []
-            err = False
-            for arg in args[ 1:3 ]:
-                if arg not in self.mn:
-                    err = True
-                    error( "node '%s' not in network\n" % arg )
-                else:
-                    hosts.append( self.mn[ arg ] )
-            if not err:
+            hosts = self._lookupHosts( args[ 1:3 ] )
+            if hosts:
                 self.mn.iperf( hosts, l4Type='UDP', udpBw=udpBw )
         else:
             error( 'invalid number of args: iperfudp bw src dst\n' +
                    'bw examples: 10M\n' )
 
+    def _lookupHosts( self, names ):
+        """Return the nodes with the given names, or None (after
+           reporting each unknown name) if any is not in the network"""
+        hosts = [ self._lookupNode( name ) for name in names ]
+        if None not in hosts:
+            return hosts
+        for name, host in zip( names, hosts ):
+            if host is None:
+                error( "node '%s' not in network\n" % name )
+        return None
+
     # ==========================================================================
     # LINK MANAGEMENT COMMANDS
     # ==========================================================================
@@ -389,15 +418,16 @@ def _validate_nodes(self, node1_name, node2_name):
             return f'Node {node2_name} not found\n'
         return None
 
+    # Types of numeric link parameters; others are kept as strings
+    # (e.g. delay='10ms')
+    linkParamTypes = { 'bw': float, 'loss': float, 'max_queue_size': int }
+
     def _parse_link_params(self, param_args):
         """Parse link parameters from command arguments."""
         params = {}
 
-        for arg in param_args:
-            if '=' not in arg:
-                continue
-
-            key, value = arg.split('=', 1)
+        for key, _, value in ( arg.partition('=') for arg in param_args
+                               if '=' in arg ):
             param_value, parse_error = self._parse_single_param(key, value)
 
             if parse_error:
@@ -410,16 +440,7 @@ def _parse_link_params(self, param_args):
     def _parse_single_param(self, key, value):
         """Parse a single parameter key-value pair."""
         try:
-            if key == 'bw':
-                return float(value), None
-            elif key == 'delay':
-                return value, None  # Keep as string (e.g., '10ms')
-            elif key == 'loss':
-                return float(value), None
-            elif key == 'max_queue_size':
-                return int(value), None
-            else:
-                return value, None  # Other parameters as strings
+            return self.linkParamTypes.get(key, str)(value), None
         except ValueError:
             return None, f'Invalid {key} value: {value}\n'
 
@@ -592,10 +613,10 @@ def do_xterm( self, line, term='xterm' ):
             error( 'usage: %s node1 node2 ...\n' % term )
         else:
             for arg in args:
-                if arg not in self.mn:
+                node = self._lookupNode( arg )
+                if node is None:
                     error( "node '%s' not in network\n" % arg )
                 else:
-                    node = self.mn[ arg ]
                     self.mn.terms += makeTerms( [ node ], term = term )
 
     def do_gterm( self, line ):
@@ -659,9 +680,15 @@ def do_dpctl( self, line ):
         if len(args) < 1:
             error( 'usage: dpctl command [arg1] [arg2] ...\n' )
             return
-        for sw in self.mn.switches:
+        # Each switch runs dpctl in its own shell, so we may run them
+        # all at once and then print the results in switch order.
+        # On ^C, interrupt the ones still running so that we can return.
+        switches = self.mn.switches
+        for sw, result in zip( switches, parallelMap(
+                lambda sw: sw.dpctl( *args ), switches,
+                interrupt=stopWaiting ) ):
             output( '*** ' + sw.name + ' ' + ('-' * 72) + '\n' )
-            output( sw.dpctl( *args ) )
+            output( result )
 
     def do_switch( self, line ):
         "Starts or stops a switch"
@@ -670,17 +697,15 @@ def do_switch( self, line ):
             error( 'invalid number of args: switch <switch name>'
                    '{start, stop}\n' )
             return
-        sw = args[ 0 ]
+        sw = self._lookupNode( args[ 0 ] )
         command = args[ 1 ]
-        if sw not in self.mn or self.mn.get( sw ) not in self.mn.switches:
+        if sw is None or sw not in self.mn.switches:
             error( 'invalid switch: %s\n' % args[ 1 ] )
         else:
-            sw = args[ 0 ]
-            command = args[ 1 ]
             if command == 'start':
-                self.mn.get( sw ).start( self.mn.controllers )
+                sw.start( self.mn.controllers )
             elif command == 'stop':
-                self.mn.get( sw ).stop( deleteIntfs=False )
+                sw.stop( deleteIntfs=False )
             else:
                 error( 'invalid command: '
                        'switch <switch name> {start, stop}\n' )
@@ -704,11 +729,8 @@ def do_sh( self, line ):
     def do_noecho( self, line ):
         """Run an interactive command with echoing turned off.
            Usage: noecho [cmd args]"""
-        if self.isatty():
-            quietRun( 'stty -echo' )
-        self.default( line )
-        if self.isatty():
-            quietRun( 'stty echo' )
+        with self.termMode( lflagsOff=termios.ECHO ):
+            self.default( line )
 
     def do_source( self, line ):
         """Read commands from an input file.
@@ -719,15 +741,12 @@ def do_source( self, line ):
             return
         try:
             with open( args[ 0 ] ) as self.inputFile:
-                while True:
-                    line = self.inputFile.readline()
-                    if len( line ) > 0:
-                        self.onecmd( line )
-                    else:
-                        break
+                # The file's own (buffered) line iterator keeps working
+                # even if a nested source resets self.inputFile
+                for cmdLine in self.inputFile:
+                    self.onecmd( cmdLine )
         except IOError:
             error( 'error reading file %s\n' % args[ 0 ] )
-        self.inputFile.close()
         self.inputFile = None
 
     def do_time( self, line ):
@@ -759,9 +778,34 @@ def do_EOF( self, line ):
     # CORE CLI FUNCTIONALITY
     # ==========================================================================
 
+    _isatty = None
+
     def isatty( self ):
         "Is our standard input a tty?"
-        return isatty( self.stdin.fileno() )
+        # Our stdin does not change, so only ask the kernel once
+        if self._isatty is None:
+            self._isatty = isatty( self.stdin.fileno() )
+        return self._isatty
+
+    @contextmanager
+    def termMode( self, lflagsOff=0, vmin=None ):
+        """Temporarily change our terminal's mode, if stdin is a tty
+           lflagsOff: local mode flags to clear (e.g. termios.ECHO)
+           vmin: minimum number of characters for a read, or None"""
+        if not self.isatty():
+            yield
+            return
+        fd = self.stdin.fileno()
+        oldAttrs = termios.tcgetattr( fd )
+        newAttrs = termios.tcgetattr( fd )
+        newAttrs[ 3 ] &= ~lflagsOff
+        if vmin is not None:
+            newAttrs[ 6 ][ termios.VMIN ] = vmin
+        termios.tcsetattr( fd, termios.TCSANOW, newAttrs )
+        try:
+            yield
+        finally:
+            termios.tcsetattr( fd, termios.TCSANOW, oldAttrs )
 
     def default( self, line ):
         """Called on an input line when the command prefix is not recognized.
@@ -771,29 +815,26 @@ def default( self, line ):
 
         first, args, line = self.parseline( line )
 
-        if first in self.mn:
+        node = self._lookupNode( first )
+        if node is not None:
             if not args:
                 error( '*** Please enter a command for node: %s <cmd>\n'
                        % first )
                 return
-            node = self.mn[ first ]
-            rest = args.split( ' ' )
             # Substitute IP addresses for node names in command
             # If updateIP() returns None, then use node name
             substituted_args = []
-            for arg in rest:
-                if arg in self.mn:
-                    target_node = self.mn[arg]
-                    default_intf = target_node.defaultIntf()
-                    if default_intf is not None:
-                        ip = default_intf.updateIP()
-                        substituted_args.append(ip or arg)
-                    else:
-                        error( f'*** Error: node {arg} has no interfaces - '
-                               f'cannot resolve IP address\n' )
-                        return
-                else:
-                    substituted_args.append(arg)
+            for arg in args.split( ' ' ):
+                target_node = self._lookupNode( arg )
+                if target_node is None:
+                    substituted_args.append( arg )
+                    continue
+                default_intf = target_node.defaultIntf()
+                if default_intf is None:
+                    error( f'*** Error: node {arg} has no interfaces - '
+                           f'cannot resolve IP address\n' )
+                    return
+                substituted_args.append( default_intf.updateIP() or arg )
 
             rest = ' '.join( substituted_args )
             # Run cmd on node:
@@ -802,58 +843,81 @@ def default( self, line ):
         else:
             error( '*** Unknown command: %s\n' % line )
 
+    def _lookupNode( self, name ):
+        """Return the node with the given name, or None; look it up
+           through self.mn, which may span several networks"""
+        return self.mn[ name ] if name in self.mn else None
+
     def waitForNode( self, node ):
         "Wait for a node to finish, and print its output."
-        # Pollers
-        nodePoller = poll()
-        nodePoller.register( node.stdout )
+        # Poll both input and node output; the returned events tell us
+        # which of the two is readable
+        stdinFd, nodeFd = self.stdin.fileno(), node.stdout.fileno()
         bothPoller = poll()
-        bothPoller.register( self.stdin, POLLIN )
-        bothPoller.register( node.stdout, POLLIN )
-        if self.isatty():
-            # Buffer by character, so that interactive
-            # commands sort of work
-            quietRun( 'stty -icanon min 1' )
-        while True:
-            try:
-                bothPoller.poll()
-                # XXX BL: this doesn't quite do what we want.
-                # pylint: disable=condition-evals-to-constant
-                if False and self.inputFile:
-                    key = self.inputFile.read( 1 )
-                    if key != '':
-                        node.write( key )
-                    else:
-                        self.inputFile = None
-                # pylint: enable=condition-evals-to-constant
-                if isReadable( self.inPoller ):
-                    key = self.stdin.read( 1 )
-                    node.write( key )
-                if isReadable( nodePoller ):
-                    data = node.monitor()
-                    output( data )
-                if not node.waiting:
-                    break
-            except KeyboardInterrupt:
-                # There is an at least one race condition here, since
-                # it's possible to interrupt ourselves after we've
-                # read data but before it has been printed.
-                node.sendInt()
-            except select.error as e:
-                # pylint: disable=unpacking-non-sequence
-                # pylint: disable=unbalanced-tuple-unpacking
-                errno_, errmsg = e.args
-                if errno_ != errno.EINTR:
-                    error( "select.error: %s, %s" % (errno_, errmsg) )
+        bothPoller.register( stdinFd, POLLIN )
+        bothPoller.register( nodeFd, POLLIN )
+        # Keystrokes may split multibyte characters across reads
+        decoder = getincrementaldecoder()
+        # Buffer by character, so that interactive
+        # commands sort of work
+        with self.termMode( lflagsOff=termios.ICANON, vmin=1 ):
+            while True:
+                try:
+                    ready = dict( bothPoller.poll() )
+                    # XXX BL: this doesn't quite do what we want.
+                    # pylint: disable=condition-evals-to-constant
+                    if False and self.inputFile:
+                        key = self.inputFile.read( 1 )
+                        if key != '':
+                            node.write( key )
+                        else:
+                            self.inputFile = None
+                    # pylint: enable=condition-evals-to-constant
+                    if ready.get( stdinFd, 0 ) & POLLIN:
+                        # Forward everything that is available in one go;
+                        # poll() said it is ready, so this will not block
+                        data = os.read( stdinFd, 4096 )
+                        node.write( decoder.decode( data ) )
+                    if ready.get( nodeFd, 0 ) & POLLIN:
+                        data = node.monitor()
+                        output( data )
+                    if not node.waiting:
+                        break
+                except KeyboardInterrupt:
+                    # There is an at least one race condition here, since
+                    # it's possible to interrupt ourselves after we've
+                    # read data but before it has been printed.
                     node.sendInt()
+                except select.error as e:
+                    # pylint: disable=unpacking-non-sequence
+                    # pylint: disable=unbalanced-tuple-unpacking
+                    errno_, errmsg = e.args
+                    if errno_ != errno.EINTR:
+                        error( "select.error: %s, %s" % (errno_, errmsg) )
+                        node.sendInt()
 
 
 # Helper functions
 
-def isReadable( poller ):
-    "Check whether a Poll object has a readable fd."
-    for fdmask in poller.poll( 0 ):
-        mask = fdmask[ 1 ]
-        if mask & POLLIN:
-            return True
-        return False
+class NodeMap( Mapping ):
+    """Read-only view of a network's nodes by name, going through its
+       own __contains__/__getitem__ (which may span several networks)"""
+
+    def __init__( self, mn ):
+        self.mn = mn
+
+    def __getitem__( self, key ):
+        if key not in self.mn:
+            raise KeyError( key )
+        return self.mn[ key ]
+
+    def __iter__( self ):
+        return iter( self.mn )
+
+    def __len__( self ):
+        return len( self.mn )
+
+def stopWaiting( node ):
+    "Interrupt node's running command, if any"
+    if node.waiting:
+        node.sendInt()
@@ -366,7 +366,7 @@ def keys( self ):
 
     def values( self ):
         "return a list of all nodes or net's values"
-        return [ self[name] for name in self ]
+        return list( chain( self.hosts, self.switches, self.controllers ) )
 
     def items( self ):
         "return (key,value) tuple list for every node in net"
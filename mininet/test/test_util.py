@@ -3,9 +3,13 @@
 """Package: mininet
    Test functions defined in mininet.util."""
 
+import os
+import signal
+import threading
 import unittest
+from time import sleep
 
-from mininet.util import quietRun
+from mininet.util import quietRun, parallelMap
 
 class testQuietRun( unittest.TestCase ):
     """Test quietRun that runs a command and returns its merged output from
@@ -35,6 +39,62 @@ def testMultipleReads( self ):
             output = quietRun(testQuietRun.getEchoCmd( n ) )
             self.assertEqual( n, len( output ) )
 
+class testParallelMap( unittest.TestCase ):
+    "Test parallelMap that runs a function over items in threads"
+
+    def testOrder( self ):
+        "Results come back in input order, not completion order"
+        items = [ 0.2, 0.0, 0.1, 0.0 ]
+        def delay( t ):
+            "Sleep for t seconds, then return t"
+            sleep( t )
+            return t
+        self.assertEqual( items, parallelMap( delay, items ) )
+        self.assertEqual( items, parallelMap( delay, items, maxWorkers=2 ) )
+
+    def testShort( self ):
+        "Empty and single item lists are mapped in the calling thread"
+        self.assertEqual( [], parallelMap( lambda x: x, [] ) )
+        self.assertEqual( [ threading.current_thread() ],
+                          parallelMap( lambda _x: threading.current_thread(),
+                                       [ 1 ] ) )
+
+    def testInterrupt( self ):
+        """On KeyboardInterrupt, interrupt is called only for the calls
+           still running, and queued calls never start"""
+        items = [ 'fast', 'hung1', 'hung2', 'queued' ]
+        started = { item: threading.Event() for item in items }
+        released = { item: threading.Event() for item in items }
+        called, interrupted = [], []
+
+        def fn( item ):
+            "Record the call; hung items wait until released"
+            called.append( item )
+            started[ item ].set()
+            if item.startswith( 'hung' ):
+                released[ item ].wait( 10 )
+            return item
+
+        def interrupt( item ):
+            "Record the interrupt and let item's call return"
+            interrupted.append( item )
+            released[ item ].set()
+
+        def sigint():
+            "Send ^C to ourselves once both hung calls are running"
+            started[ 'hung1' ].wait( 10 )
+            started[ 'hung2' ].wait( 10 )
+            # Give the main thread time to finish submitting and block
+            # on the first result
+            sleep( .2 )
+            os.kill( os.getpid(), signal.SIGINT )
+
+        threading.Thread( target=sigint ).start()
+        with self.assertRaises( KeyboardInterrupt ):
+            parallelMap( fn, items, maxWorkers=2, interrupt=interrupt )
+        self.assertEqual( [ 'hung1', 'hung2' ], interrupted )
+        self.assertNotIn( 'queued', called )
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -6,6 +6,7 @@
 import sys
 
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from fcntl import fcntl, F_GETFL, F_SETFL
 from functools import partial
 from os import O_NONBLOCK
@@ -495,6 +496,34 @@ def pmonitor(popens, timeoutms=500, readline=True,
         else:
             yield None, ''
 
+def parallelMap( fn, items, maxWorkers=32, interrupt=None ):
+    """Return [ fn( item ) for item in items ], running the calls in
+       threads; useful when fn mostly waits for a subprocess
+       maxWorkers: maximum number of threads
+       interrupt: on KeyboardInterrupt, called with each item whose call
+           is still running, to make it return before we re-raise"""
+    if len( items ) < 2:
+        return [ fn( item ) for item in items ]
+    executor = ThreadPoolExecutor(
+        max_workers=min( maxWorkers, len( items ) ) )
+    futures = []
+    try:
+        for item in items:
+            futures.append( executor.submit( fn, item ) )
+        return [ future.result() for future in futures ]
+    except KeyboardInterrupt:
+        # Cancel queued calls first, so that interrupting a running one
+        # cannot free a thread to start another
+        for future in futures:
+            future.cancel()
+        if interrupt:
+            for item, future in zip( items, futures ):
+                if not future.done():
+                    interrupt( item )
+        raise
+    finally:
+        executor.shutdown( wait=True )
+
 # Other stuff we use
 def sysctlTestAndSet( name, limit ):
     "Helper function to set sysctl limits"